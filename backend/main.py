@@ -1,16 +1,43 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, AsyncIterator, Union, Awaitable, Callable, Set
 import os
-import re
+import json
+import asyncio
+import hashlib
+import uuid
+from dataclasses import dataclass
+from functools import lru_cache, partial
+from cachetools import LRUCache, TTLCache
 from dotenv import load_dotenv
 import openai
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic
 
 load_dotenv()
 
-app = FastAPI(title="Agent Skills Tester")
+# Settings
+@dataclass(frozen=True)
+class Settings:
+    openai_api_key: Optional[str]
+    anthropic_api_key: Optional[str]
+    openai_key_valid: bool
+    anthropic_key_valid: bool
+
+@lru_cache()
+def get_settings() -> Settings:
+    """Read configuration from the environment once and reuse it for every request"""
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    anthropic_api_key = os.getenv("ANTHROPIC_API_KEY")
+    return Settings(
+        openai_api_key=openai_api_key,
+        anthropic_api_key=anthropic_api_key,
+        openai_key_valid=bool(openai_api_key) and openai_api_key != "your_openai_api_key_here",
+        anthropic_key_valid=bool(anthropic_api_key) and anthropic_api_key != "your_anthropic_api_key_here",
+    )
+
+app = FastAPI(title="Agent Skills Tester", default_response_class=ORJSONResponse)
 
 # CORS middleware
 app.add_middleware(
@@ -21,25 +48,178 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize clients
-openai_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-anthropic_client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+# Initialize clients (async so LLM round-trips don't block the event loop)
+openai_client = openai.AsyncOpenAI(api_key=get_settings().openai_api_key)
+anthropic_client = AsyncAnthropic(api_key=get_settings().anthropic_api_key)
+
+# Exact-match cache for LLM responses
+class LLMResponseCache:
+    """TTL cache of LLM responses keyed by a hash of provider, model and prompt parts."""
+
+    def __init__(self, maxsize: int = 1000, ttl: int = 3600):
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def hash_key(*parts: str) -> str:
+        # JSON-encode the parts so no combination of separators in them can collide
+        return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Any:
+        value = self._cache.get(key)
+        if value is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._cache[key] = value
+
+    def stats(self) -> Dict[str, Any]:
+        total = self._hits + self._misses
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / total if total else 0.0,
+            "size": len(self._cache),
+            "maxsize": self._cache.maxsize,
+            "ttl": self._cache.ttl,
+        }
+
+response_cache = LLMResponseCache()
+
+# Client-side batching of concurrent LLM calls
+BATCH_SIZE = 8
+MAX_WAIT_MS = 20
+
+class LLMBatcher:
+    """Collects concurrent LLM requests and submits them together in batches.
+
+    A background collector pops up to `batch_size` pending calls and runs them
+    concurrently over the shared client connection pool, resolving each caller's future.
+    A lone call is dispatched immediately; only when others are already queued does the
+    collector wait up to `max_wait_ms` for the batch to fill. Cancelling a caller cancels
+    its provider call. Streaming calls bypass it.
+    """
+
+    def __init__(self, batch_size: int = BATCH_SIZE, max_wait_ms: int = MAX_WAIT_MS):
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._dispatches: Set[asyncio.Task] = set()
+
+    async def submit(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        # Started lazily so the collector runs on the server's event loop
+        if self._collector is None or self._collector.done():
+            self._queue = asyncio.Queue()
+            self._collector = asyncio.create_task(self._collect())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((call, future))
+        return await future
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            # Only wait for more calls when a burst is already queued; a lone call goes out now
+            if not self._queue.empty():
+                deadline = loop.time() + self.max_wait
+                while len(batch) < self.batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            # Dispatch without awaiting so the next batch can be collected meanwhile
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch: List[Tuple[Callable[[], Awaitable[Any]], asyncio.Future]]) -> None:
+        started = []
+        tasks = []
+        for call, future in batch:
+            # Callers cancelled while queued never reach the provider
+            if future.done():
+                continue
+            try:
+                task = asyncio.ensure_future(call())
+            except Exception as e:
+                # e.g. an SDK rejecting its arguments before returning a coroutine
+                future.set_exception(e)
+                continue
+            # Cancel the provider call if the caller goes away (e.g. client disconnect)
+            future.add_done_callback(lambda f, task=task: task.cancel() if f.cancelled() else None)
+            started.append((call, future))
+            tasks.append(task)
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for (_, future), result in zip(started, results):
+            if future.done():
+                continue  # caller went away
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+llm_batcher = LLMBatcher()
+
+# Record id generator
+_new_id = uuid.uuid4
 
 # In-memory storage (replace with database in production)
-agents_db: Dict[str, Dict] = {}
-tools_db: Dict[str, Dict] = {}
+class Store:
+    """In-memory records indexed by id, with a ready-to-serve row list kept in sync on writes.
+
+    Reads go through the id index or the prebuilt rows list; writes should hold `lock`.
+    Mutations replace `rows` rather than editing it in place, so a list already handed
+    to a response is never changed underneath it.
+    """
+
+    def __init__(self):
+        self.by_id: Dict[str, Dict] = {}
+        self.rows: List[Dict] = []
+        self.lock = asyncio.Lock()
+
+    def __contains__(self, record_id: str) -> bool:
+        return record_id in self.by_id
+
+    def __getitem__(self, record_id: str) -> Dict:
+        return self.by_id[record_id]
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def put(self, record: Dict) -> Dict:
+        record_id = record["id"]
+        if record_id in self.by_id:
+            self.rows = [record if row["id"] == record_id else row for row in self.rows]
+        else:
+            self.rows = self.rows + [record]
+        self.by_id[record_id] = record
+        return record
+
+    def remove(self, record_id: str) -> None:
+        del self.by_id[record_id]
+        self.rows = [row for row in self.rows if row["id"] != record_id]
+
+agents_db = Store()
+tools_db = Store()
 
 # Initialize example data
 def initialize_examples():
     """Initialize example tools and agents for users"""
-    import uuid
     
     # Check if examples already exist
     if tools_db or agents_db:
         return  # Don't reinitialize if data already exists
     
     # Create example tool: Enterprise Pricing Strategy
-    pricing_tool_id = str(uuid.uuid4())
+    pricing_tool_id = _new_id().hex
     pricing_tool = {
         "id": pricing_tool_id,
         "name": "Enterprise Pricing Strategy",
@@ -66,10 +246,37 @@ Micro Case
 
 Deliver a short, product specific example in two sentences.""",
     }
-    tools_db[pricing_tool_id] = pricing_tool
+    tools_db.put(pricing_tool)
+    
+    # Create example tool: Customer Retention Playbook
+    # (a second tool keeps on-demand tool selection in the Business Copilot demo)
+    retention_tool_id = _new_id().hex
+    retention_tool = {
+        "id": retention_tool_id,
+        "name": "Customer Retention Playbook",
+        "description": "Activate this for churn and customer retention questions",
+        "prompt_piece": """Retention Playbook Output
+
+Churn Diagnosis
+
+Split churn into onboarding, value realization, and renewal stages and name the weakest stage.
+
+Health Signals
+
+List three leading indicators of churn risk that can be tracked weekly.
+
+Save Plays
+
+Propose one intervention per stage, each with an owner and a trigger.
+
+Success Metric
+
+Provide a target net revenue retention range for the next two quarters.""",
+    }
+    tools_db.put(retention_tool)
     
     # Create example agent: Business Copilot
-    business_copilot_id = str(uuid.uuid4())
+    business_copilot_id = _new_id().hex
     business_copilot = {
         "id": business_copilot_id,
         "name": "Business Copilot",
@@ -78,13 +285,19 @@ Deliver a short, product specific example in two sentences.""",
             "model": "gpt-4"
         },
         "system_prompt": "You provide clear, concise business guidance. Keep responses brief, structured when helpful, and grounded in standard business logic. Request missing details only when required.",
-        "tool_ids": [pricing_tool_id]
+        "tool_ids": [pricing_tool_id, retention_tool_id]
     }
-    agents_db[business_copilot_id] = business_copilot
+    agents_db.put(business_copilot)
 
 # Initialize examples on startup
 initialize_examples()
 
+# Name of the function the model calls to request tool content
+TOOL_SELECTOR_NAME = "use_tools"
+
+# Agents with at most this many tools get their tool content inline, skipping the tool-selection call
+INLINE_TOOL_LIMIT = 1
+
 # Models
 class LLMModel(BaseModel):
     provider: str  # "openai", "anthropic"
@@ -119,69 +332,281 @@ class AgentCreate(BaseModel):
     tool_ids: List[str] = []
 
 
-# Helper function to build prompt with tool metadata only
-def build_prompt_with_tool_metadata(system_prompt: str, user_message: str, tool_ids: List[str]) -> str:
-    """Build the prompt with only tool names and descriptions (not full content)."""
+# Rendered tool sections keyed by (kind, sorted tool ids). The key already changes when an
+# agent's tool_ids change, so only tool mutations need to clear it. Bounded because every
+# distinct subset of tools the model requests gets its own content entry.
+tool_section_cache: LRUCache = LRUCache(maxsize=256)
+
+def cached_tool_section(kind: str, tool_ids: List[str], build: Callable[[Tuple[str, ...]], Any]) -> Any:
+    """Return the cached section for this set of tools, building it on first use"""
+    key = (kind, tuple(sorted(tool_ids)))
+    if key not in tool_section_cache:
+        tool_section_cache[key] = build(key[1])
+    return tool_section_cache[key]
+
+def render_tool_metadata_section(sorted_tool_ids: Tuple[str, ...]) -> str:
     tool_list = []
-    for tool_id in tool_ids:
+    for tool_id in sorted_tool_ids:
         if tool_id in tools_db:
             tool = tools_db[tool_id]
-            tool_list.append(f"- {tool['name']}: {tool['description']}")
+            tool_list.append(f"- {tool['name'].strip()}: {tool['description'].strip()}")
     
-    if tool_list:
-        tools_section = "\n\nAvailable Tools:\n" + "\n".join(tool_list)
-        tools_section += "\n\nTo use a tool, include [USE_TOOL: ToolName] in your response. The tool's detailed content will then be provided to you. Do not mention this format to the user."
-    else:
-        tools_section = ""
-    
-    full_prompt = f"{system_prompt}{tools_section}\n\nUser: {user_message}\n\nAssistant:"
-    return full_prompt
+    if not tool_list:
+        return ""
+    tools_section = "\n\nAvailable Tools:\n" + "\n".join(tool_list)
+    tools_section += f"\n\nTo use a tool, call the {TOOL_SELECTOR_NAME} function with the names of the tools you need. The tools' detailed content will then be provided to you. Do not mention this to the user."
+    return tools_section
+
+def render_tool_selector(sorted_tool_ids: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+    tool_names = [tools_db[tool_id]['name'] for tool_id in sorted_tool_ids if tool_id in tools_db]
+    if not tool_names:
+        return None
+    return {
+        "name": TOOL_SELECTOR_NAME,
+        "description": "Request the detailed content of one or more of the available tools.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "tool_names": {
+                    "type": "array",
+                    "items": {"type": "string", "enum": tool_names},
+                    "description": "Names of the tools whose content is needed to answer.",
+                }
+            },
+            "required": ["tool_names"],
+        },
+    }
 
-# Helper function to build prompt with full tool content
-def build_prompt_with_tool_content(system_prompt: str, user_message: str, tool_ids: List[str]) -> str:
-    """Build the prompt with full tool content included."""
+def render_tool_content_section(sorted_tool_ids: Tuple[str, ...]) -> str:
     tool_pieces = []
-    for tool_id in tool_ids:
+    for tool_id in sorted_tool_ids:
         if tool_id in tools_db:
             tool = tools_db[tool_id]
-            tool_pieces.append(f"\n\n[{tool['name']}]\n{tool['prompt_piece']}")
-    
-    tools_section = "\n".join(tool_pieces) if tool_pieces else ""
+            tool_pieces.append(f"\n\n[{tool['name'].strip()}]\n{tool['prompt_piece'].strip()}")
     
+    if not tool_pieces:
+        return ""
     # Instruction to use information naturally without mentioning tools
-    if tools_section:
-        instruction = "\n\nUse the information provided above naturally in your response. Do not mention that you are using tools or referencing specific resources - just provide a helpful answer using the available information."
-    else:
-        instruction = ""
-    
-    full_prompt = f"{system_prompt}{tools_section}{instruction}\n\nUser: {user_message}\n\nAssistant:"
-    return full_prompt
+    instruction = "\n\nUse the information provided above naturally in your response. Do not mention that you are using tools or referencing specific resources - just provide a helpful answer using the available information."
+    return "\n".join(tool_pieces) + instruction
+
+# Helper function to build prompt with tool metadata only
+def build_prompt_with_tool_metadata(system_prompt: str, user_message: str, tool_ids: List[str]) -> Tuple[str, str]:
+    """Build the (system, user) prompt pair with only tool names and descriptions (not full content).
+
+    The system prompt and tools section form a byte-stable prefix (tools sorted by id,
+    whitespace stripped) so providers can reuse their prompt cache across requests.
+    """
+    tools_section = cached_tool_section("metadata", tool_ids, render_tool_metadata_section)
+    return f"{system_prompt.strip()}{tools_section}", user_message.strip()
+
+# Helper function to build the tool-selection schema shown to the model
+def build_tool_selector(tool_ids: List[str]) -> Optional[Dict[str, Any]]:
+    """Build the provider-neutral schema for the tool-selection function, or None if there are no tools."""
+    return cached_tool_section("selector", tool_ids, render_tool_selector)
+
+# Helper function to build prompt with full tool content
+def build_prompt_with_tool_content(system_prompt: str, user_message: str, tool_ids: List[str]) -> Tuple[str, str]:
+    """Build the (system, user) prompt pair with full tool content included, keeping the same stable prefix ordering."""
+    tools_section = cached_tool_section("content", tool_ids, render_tool_content_section)
+    return f"{system_prompt.strip()}{tools_section}", user_message.strip()
+
+# Helper function to render a (system, user) pair as a single prompt for display
+def format_full_prompt(system: str, user: str) -> str:
+    """Render the prompt the way it is shown to users in chat responses."""
+    return f"{system}\n\nUser: {user}\n\nAssistant:"
+
+# Helper function to mark the Anthropic system prompt as a cacheable prefix
+def anthropic_system_blocks(system_content: str) -> List[Dict[str, Any]]:
+    """Wrap the system prompt so Anthropic caches it (and the tools before it) between requests."""
+    return [{"type": "text", "text": system_content, "cache_control": {"type": "ephemeral"}}]
 
 # Helper function to call LLM
-async def call_llm(model: LLMModel, prompt: str) -> str:
-    """Call the appropriate LLM based on provider"""
+async def call_llm(model: LLMModel, system: str, user: str, stream: bool = False) -> Union[str, AsyncIterator[str]]:
+    """Call the appropriate LLM based on provider, serving repeated prompts from the response cache.
+
+    With stream=True, returns an async iterator of text deltas instead of the full text.
+    """
+    if stream:
+        return stream_llm(model, system, user)
+    cache_key = LLMResponseCache.hash_key("chat", model.provider, model.model, system, user)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
     if model.provider == "openai":
-        response = openai_client.chat.completions.create(
+        response = await llm_batcher.submit(partial(
+            openai_client.chat.completions.create,
             model=model.model,
             messages=[
-                {"role": "system", "content": prompt.split("User:")[0].strip()},
-                {"role": "user", "content": prompt.split("User:")[-1].replace("Assistant:", "").strip()}
+                {"role": "system", "content": system},
+                {"role": "user", "content": user}
             ],
             temperature=0.7
-        )
-        return response.choices[0].message.content
+        ))
+        result = response.choices[0].message.content
     elif model.provider == "anthropic":
-        system_content = prompt.split("User:")[0].strip()
-        user_content = prompt.split("User:")[-1].replace("Assistant:", "").strip()
-        response = anthropic_client.messages.create(
+        response = await llm_batcher.submit(partial(
+            anthropic_client.messages.create,
             model=model.model,
             max_tokens=1024,
-            system=system_content,
-            messages=[{"role": "user", "content": user_content}]
+            system=anthropic_system_blocks(system),
+            messages=[{"role": "user", "content": user}]
+        ))
+        result = response.content[0].text
+    else:
+        raise HTTPException(status_code=400, detail=f"Unsupported provider: {model.provider}")
+    response_cache.set(cache_key, result)
+    return result
+
+# Helper function to stream the LLM response as text deltas
+async def stream_llm(model: LLMModel, system: str, user: str) -> AsyncIterator[str]:
+    """Stream the LLM response, sharing the response cache with call_llm"""
+    cache_key = LLMResponseCache.hash_key("chat", model.provider, model.model, system, user)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        yield cached
+        return
+    parts = []
+    if model.provider == "openai":
+        stream = await openai_client.chat.completions.create(
+            model=model.model,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": user}
+            ],
+            temperature=0.7,
+            stream=True
         )
-        return response.content[0].text
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        finally:
+            # Close the HTTP response if the client disconnects so generation stops
+            await stream.response.aclose()
+    elif model.provider == "anthropic":
+        async with anthropic_client.messages.stream(
+            model=model.model,
+            max_tokens=1024,
+            system=anthropic_system_blocks(system),
+            messages=[{"role": "user", "content": user}]
+        ) as stream:
+            async for delta in stream.text_stream:
+                parts.append(delta)
+                yield delta
+    else:
+        raise HTTPException(status_code=400, detail=f"Unsupported provider: {model.provider}")
+    response_cache.set(cache_key, "".join(parts))
+
+# Helper function to read the tool names out of a tool-selection call
+def parse_tool_selector_input(arguments: Any) -> List[str]:
+    """Return the string tool names from the call's input, ignoring anything malformed.
+
+    Tool-call input isn't schema-enforced by either provider, so it is validated here.
+    """
+    if not isinstance(arguments, dict):
+        return []
+    tool_names = arguments.get("tool_names")
+    if not isinstance(tool_names, list):
+        return []
+    return [name for name in tool_names if isinstance(name, str)]
+
+# Helper function to let the LLM pick tools via native function-calling / tool-use
+async def select_tools(model: LLMModel, system: str, user: str, selector: Optional[Dict[str, Any]]) -> Tuple[Optional[str], List[str]]:
+    """Call the LLM with the tool-selection function attached.
+
+    Returns the text response and the tool names the model requested. The text is None
+    when the model called the tool-selection function, since that turn is not an answer.
+    """
+    cache_key = LLMResponseCache.hash_key("select", model.provider, model.model, system, user)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached[0], list(cached[1])
+    requested_names: List[str] = []
+    selector_called = False
+    if model.provider == "openai":
+        kwargs: Dict[str, Any] = {}
+        if selector:
+            kwargs["tools"] = [{"type": "function", "function": selector}]
+            kwargs["tool_choice"] = "auto"
+        response = await llm_batcher.submit(partial(
+            openai_client.chat.completions.create,
+            model=model.model,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": user}
+            ],
+            temperature=0.7,
+            **kwargs
+        ))
+        message = response.choices[0].message
+        for tool_call in message.tool_calls or []:
+            if tool_call.function.name == TOOL_SELECTOR_NAME:
+                selector_called = True
+                try:
+                    arguments = json.loads(tool_call.function.arguments)
+                except ValueError:
+                    arguments = None
+                requested_names.extend(parse_tool_selector_input(arguments))
+        text = message.content or ""
+    elif model.provider == "anthropic":
+        kwargs = {}
+        if selector:
+            kwargs["tools"] = [{
+                "name": selector["name"],
+                "description": selector["description"],
+                "input_schema": selector["parameters"],
+            }]
+        response = await llm_batcher.submit(partial(
+            anthropic_client.messages.create,
+            model=model.model,
+            max_tokens=1024,
+            system=anthropic_system_blocks(system),
+            messages=[{"role": "user", "content": user}],
+            **kwargs
+        ))
+        text_parts = []
+        for block in response.content:
+            if block.type == "text":
+                text_parts.append(block.text)
+            elif block.type == "tool_use" and block.name == TOOL_SELECTOR_NAME:
+                selector_called = True
+                requested_names.extend(parse_tool_selector_input(block.input))
+        text = "".join(text_parts)
     else:
         raise HTTPException(status_code=400, detail=f"Unsupported provider: {model.provider}")
+    if selector_called:
+        text = None
+    response_cache.set(cache_key, (text, tuple(requested_names)))
+    return text, requested_names
+
+# Helper function to map LLM SDK errors to HTTP errors
+def llm_error_to_http_exception(e: Exception) -> HTTPException:
+    """Translate an LLM call failure into an HTTPException with a user-facing message"""
+    if isinstance(e, HTTPException):
+        return e
+    error_msg = str(e)
+    if "api_key" in error_msg.lower() or "authentication" in error_msg.lower():
+        return HTTPException(
+            status_code=401,
+            detail=f"API authentication failed: {error_msg}. Please check your API key."
+        )
+    elif "model" in error_msg.lower():
+        return HTTPException(
+            status_code=400,
+            detail=f"Model error: {error_msg}. Please check the model name."
+        )
+    else:
+        return HTTPException(
+            status_code=500,
+            detail=f"LLM API error: {error_msg}"
+        )
+
+# Helper function to format a server-sent event
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 # API Routes
 
@@ -205,24 +630,30 @@ async def get_available_models():
         ]
     }
 
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Get LLM response cache statistics"""
+    return response_cache.stats()
+
 @app.post("/api/tools", response_model=Tool)
 async def create_tool(tool: ToolCreate):
     """Create a new tool/prompt piece"""
-    import uuid
-    tool_id = str(uuid.uuid4())
+    tool_id = _new_id().hex
     tool_data = {
         "id": tool_id,
         "name": tool.name,
         "description": tool.description,
         "prompt_piece": tool.prompt_piece
     }
-    tools_db[tool_id] = tool_data
+    async with tools_db.lock:
+        tools_db.put(tool_data)
+        tool_section_cache.clear()
     return tool_data
 
-@app.get("/api/tools", response_model=List[Tool])
+@app.get("/api/tools", response_class=ORJSONResponse)
 async def get_tools():
-    """Get all tools"""
-    return list(tools_db.values())
+    """Get all tools (rows are validated on write, so no response model re-validation)"""
+    return tools_db.rows
 
 @app.get("/api/tools/{tool_id}", response_model=Tool)
 async def get_tool(tool_id: str):
@@ -234,43 +665,46 @@ async def get_tool(tool_id: str):
 @app.put("/api/tools/{tool_id}", response_model=Tool)
 async def update_tool(tool_id: str, tool: ToolCreate):
     """Update a tool"""
-    if tool_id not in tools_db:
-        raise HTTPException(status_code=404, detail="Tool not found")
-    tools_db[tool_id] = {
-        "id": tool_id,
-        "name": tool.name,
-        "description": tool.description,
-        "prompt_piece": tool.prompt_piece
-    }
-    return tools_db[tool_id]
+    async with tools_db.lock:
+        if tool_id not in tools_db:
+            raise HTTPException(status_code=404, detail="Tool not found")
+        tool_section_cache.clear()
+        return tools_db.put({
+            "id": tool_id,
+            "name": tool.name,
+            "description": tool.description,
+            "prompt_piece": tool.prompt_piece
+        })
 
 @app.delete("/api/tools/{tool_id}")
 async def delete_tool(tool_id: str):
     """Delete a tool"""
-    if tool_id not in tools_db:
-        raise HTTPException(status_code=404, detail="Tool not found")
-    del tools_db[tool_id]
+    async with tools_db.lock:
+        if tool_id not in tools_db:
+            raise HTTPException(status_code=404, detail="Tool not found")
+        tools_db.remove(tool_id)
+        tool_section_cache.clear()
     return {"message": "Tool deleted"}
 
 @app.post("/api/agents", response_model=Agent)
 async def create_agent(agent: AgentCreate):
     """Create a new agent"""
-    import uuid
-    agent_id = str(uuid.uuid4())
+    agent_id = _new_id().hex
     agent_data = {
         "id": agent_id,
         "name": agent.name,
-        "llm_model": agent.llm_model.dict(),
+        "llm_model": agent.llm_model.model_dump(),
         "system_prompt": agent.system_prompt,
         "tool_ids": agent.tool_ids
     }
-    agents_db[agent_id] = agent_data
+    async with agents_db.lock:
+        agents_db.put(agent_data)
     return agent_data
 
-@app.get("/api/agents", response_model=List[Agent])
+@app.get("/api/agents", response_class=ORJSONResponse)
 async def get_agents():
-    """Get all agents"""
-    return list(agents_db.values())
+    """Get all agents (rows are validated on write, so no response model re-validation)"""
+    return agents_db.rows
 
 @app.get("/api/agents/{agent_id}", response_model=Agent)
 async def get_agent(agent_id: str):
@@ -282,33 +716,40 @@ async def get_agent(agent_id: str):
 @app.put("/api/agents/{agent_id}", response_model=Agent)
 async def update_agent(agent_id: str, agent: AgentCreate):
     """Update an agent"""
-    if agent_id not in agents_db:
-        raise HTTPException(status_code=404, detail="Agent not found")
-    agents_db[agent_id] = {
-        "id": agent_id,
-        "name": agent.name,
-        "llm_model": agent.llm_model.dict(),
-        "system_prompt": agent.system_prompt,
-        "tool_ids": agent.tool_ids
-    }
-    return agents_db[agent_id]
+    async with agents_db.lock:
+        if agent_id not in agents_db:
+            raise HTTPException(status_code=404, detail="Agent not found")
+        return agents_db.put({
+            "id": agent_id,
+            "name": agent.name,
+            "llm_model": agent.llm_model.model_dump(),
+            "system_prompt": agent.system_prompt,
+            "tool_ids": agent.tool_ids
+        })
 
 @app.delete("/api/agents/{agent_id}")
 async def delete_agent(agent_id: str):
     """Delete an agent"""
-    if agent_id not in agents_db:
-        raise HTTPException(status_code=404, detail="Agent not found")
-    del agents_db[agent_id]
+    async with agents_db.lock:
+        if agent_id not in agents_db:
+            raise HTTPException(status_code=404, detail="Agent not found")
+        agents_db.remove(agent_id)
     return {"message": "Agent deleted"}
 
 @app.post("/api/agents/{agent_id}/chat")
 async def chat_with_agent(agent_id: str, request: AgentRequest):
-    """Chat with an agent - automatically detects and uses relevant tools"""
+    """Chat with an agent - automatically detects and uses relevant tools.
+
+    The answer is streamed as server-sent events: a "meta" event with the tools used and
+    full prompt, "delta" events with response text, an "error" event if the LLM fails
+    mid-stream, and a final "done" event.
+    """
     if agent_id not in agents_db:
         raise HTTPException(status_code=404, detail="Agent not found")
     
     agent = agents_db[agent_id]
-    llm_model = LLMModel(**agent["llm_model"])
+    # Stored llm_model was validated when the agent was created/updated
+    llm_model = LLMModel.model_construct(**agent["llm_model"])
     
     # Validate model is set
     if not llm_model.model or llm_model.model.strip() == "":
@@ -318,83 +759,90 @@ async def chat_with_agent(agent_id: str, request: AgentRequest):
         )
     
     # Validate API key is set
+    settings = get_settings()
     if llm_model.provider == "openai":
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key or api_key == "your_openai_api_key_here":
+        if not settings.openai_key_valid:
             raise HTTPException(
                 status_code=400,
                 detail="OpenAI API key is not configured. Please set OPENAI_API_KEY in your .env file."
             )
     elif llm_model.provider == "anthropic":
-        api_key = os.getenv("ANTHROPIC_API_KEY")
-        if not api_key or api_key == "your_anthropic_api_key_here":
+        if not settings.anthropic_key_valid:
             raise HTTPException(
                 status_code=400,
                 detail="Anthropic API key is not configured. Please set ANTHROPIC_API_KEY in your .env file."
             )
+    else:
+        # Checked here because failures after the stream starts can only be reported in-band
+        raise HTTPException(status_code=400, detail=f"Unsupported provider: {llm_model.provider}")
     
     # Get all tools associated with this agent
     agent_tool_ids = agent["tool_ids"]
     
-    # Step 1: Show tool metadata (names and descriptions) to the model
-    initial_prompt = build_prompt_with_tool_metadata(
-        agent["system_prompt"],
-        request.user_message,
-        agent_tool_ids
-    )
+    available_tool_ids = [tool_id for tool_id in agent_tool_ids if tool_id in tools_db]
+    initial_response: Optional[str] = None
     
-    # Step 2: First LLM call - model sees available tools and can request them
     try:
-        initial_response = await call_llm(llm_model, initial_prompt)
-        
-        # Step 3: Detect which tools the model requested using [USE_TOOL: ToolName] format
-        requested_tool_ids = []
-        tool_markers = re.findall(r'\[USE_TOOL:\s*([^\]]+)\]', initial_response, re.IGNORECASE)
-        
-        # Match tool names from markers
-        for marker_tool_name in tool_markers:
-            marker_tool_name_lower = marker_tool_name.strip().lower()
-            for tool_id in agent_tool_ids:
-                if tool_id in tools_db:
-                    tool = tools_db[tool_id]
-                    if tool['name'].lower() == marker_tool_name_lower:
-                        if tool_id not in requested_tool_ids:
-                            requested_tool_ids.append(tool_id)
-        
-        # Step 4: If model requested tools, make second call with tool content
-        if requested_tool_ids:
-            final_prompt = build_prompt_with_tool_content(
+        if len(available_tool_ids) <= INLINE_TOOL_LIMIT:
+            # Few enough tools that including them outright is cheaper than a tool-selection call
+            final_system, final_user = build_prompt_with_tool_content(
                 agent["system_prompt"],
                 request.user_message,
-                requested_tool_ids
+                available_tool_ids
             )
-            final_response = await call_llm(llm_model, final_prompt)
-            # Remove tool markers from the final response
-            response = re.sub(r'\[USE_TOOL:\s*[^\]]+\]', '', final_response, flags=re.IGNORECASE).strip()
-            tools_used = requested_tool_ids
-            full_prompt = final_prompt
+            tools_used = available_tool_ids
+            full_prompt = format_full_prompt(final_system, final_user)
         else:
-            # No tools requested, use initial response but remove any markers
-            response = re.sub(r'\[USE_TOOL:\s*[^\]]+\]', '', initial_response, flags=re.IGNORECASE).strip()
-            tools_used = []
-            full_prompt = initial_prompt
-    except Exception as e:
-        error_msg = str(e)
-        if "api_key" in error_msg.lower() or "authentication" in error_msg.lower():
-            raise HTTPException(
-                status_code=401,
-                detail=f"API authentication failed: {error_msg}. Please check your API key."
-            )
-        elif "model" in error_msg.lower():
-            raise HTTPException(
-                status_code=400,
-                detail=f"Model error: {error_msg}. Please check the model name."
-            )
-        else:
-            raise HTTPException(
-                status_code=500,
-                detail=f"LLM API error: {error_msg}"
+            # Step 1: Show tool metadata (names and descriptions) to the model
+            initial_system, initial_user = build_prompt_with_tool_metadata(
+                agent["system_prompt"],
+                request.user_message,
+                available_tool_ids
             )
+            selector = build_tool_selector(available_tool_ids)
+            
+            # Step 2: First LLM call - model sees available tools and can request them via tool-calling
+            initial_response, requested_tool_names = await select_tools(llm_model, initial_system, initial_user, selector)
+            
+            # Step 3: Resolve the tool names the model requested to tool ids (case-insensitive)
+            # Tools may have been deleted while the selection call was in flight
+            name_to_id = {
+                tools_db[tool_id]['name'].lower(): tool_id
+                for tool_id in available_tool_ids
+                if tool_id in tools_db
+            }
+            requested_keys = (name.strip().lower() for name in requested_tool_names)
+            # dict.fromkeys de-duplicates while keeping the order the model requested them in
+            requested_tool_ids = list(dict.fromkeys(
+                name_to_id[key] for key in requested_keys if key in name_to_id
+            ))
+            
+            # Step 4: If model requested tools, the second call (streamed below) gets the tool content
+            if requested_tool_ids:
+                final_system, final_user = build_prompt_with_tool_content(
+                    agent["system_prompt"],
+                    request.user_message,
+                    requested_tool_ids
+                )
+                tools_used = requested_tool_ids
+                full_prompt = format_full_prompt(final_system, final_user)
+                initial_response = None
+            elif initial_response is None:
+                # The model called the tool-selection function but no name resolved to a
+                # tool (malformed or unknown names); stream a real answer without tools
+                final_system, final_user = build_prompt_with_tool_content(
+                    agent["system_prompt"],
+                    request.user_message,
+                    []
+                )
+                tools_used = []
+                full_prompt = format_full_prompt(final_system, final_user)
+            else:
+                # No tools requested, the initial response is the answer
+                tools_used = []
+                full_prompt = format_full_prompt(initial_system, initial_user)
+    except Exception as e:
+        raise llm_error_to_http_exception(e)
     
     # Get tool names for the response
     tool_names = []
@@ -402,14 +850,35 @@ async def chat_with_agent(agent_id: str, request: AgentRequest):
         if tool_id in tools_db:
             tool_names.append(tools_db[tool_id]['name'])
     
-    return {
-        "response": response,
-        "tools_used": tools_used,
-        "tools_used_names": tool_names,
-        "full_prompt": full_prompt
-    }
+    async def event_stream():
+        yield format_sse("meta", {
+            "tools_used": tools_used,
+            "tools_used_names": tool_names,
+            "full_prompt": full_prompt
+        })
+        try:
+            if initial_response is None:
+                async for delta in await call_llm(llm_model, final_system, final_user, stream=True):
+                    yield format_sse("delta", {"text": delta})
+            else:
+                yield format_sse("delta", {"text": initial_response.strip()})
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            yield format_sse("error", {"detail": llm_error_to_http_exception(e).detail})
+        yield format_sse("done", {})
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Storage is in-memory and per-process, so only raise the worker count once it is shared
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        # "auto" picks uvloop/httptools when installed (uvicorn[standard], not on Windows)
+        loop="auto",
+        http="auto",
+        workers=int(os.getenv("UVICORN_WORKERS", "1")),
+    )
 
@@ -51,14 +51,27 @@ function App() {
     setChatMessages(prev => [...prev, { role: 'user', content: userMessage }])
     setIsThinking(true)
 
-    try {
-      const response: ChatResponse = await api.chatWithAgent(selectedAgent, userMessage)
-      setChatMessages(prev => [...prev, { 
-        role: 'assistant', 
+    // Show the assistant message as soon as the first tokens stream in, then keep updating it.
+    // isThinking stays set until the stream finishes so no new message can be sent mid-stream.
+    let streaming = false
+    const showResponse = (response: ChatResponse) => {
+      const message = {
+        role: 'assistant' as const,
         content: response.response,
         toolsUsed: response.tools_used,
         toolsUsedNames: response.tools_used_names
-      }])
+      }
+      if (streaming) {
+        setChatMessages(prev => [...prev.slice(0, -1), message])
+      } else {
+        streaming = true
+        setChatMessages(prev => [...prev, message])
+      }
+    }
+
+    try {
+      const response: ChatResponse = await api.chatWithAgent(selectedAgent, userMessage, showResponse)
+      showResponse(response)
     } catch (error: any) {
       console.error('Failed to send message:', error)
       let errorMessage = 'Failed to get response from agent.'
@@ -603,7 +616,7 @@ function ChatTab({
                       )}
                     </div>
                   ))}
-                  {isThinking && (
+                  {isThinking && messages[messages.length - 1]?.role !== 'assistant' && (
                     <div className="chat-message assistant thinking-message">
                       <div className="thinking-loader">
                         <span className="thinking-dot"></span>
@@ -35,6 +35,19 @@ const handleResponse = async (response: Response) => {
   return response.json();
 };
 
+const parseSseFrame = (frame: string): { event: string; data: any } => {
+  let event = 'message';
+  const dataLines: string[] = [];
+  for (const line of frame.split('\n')) {
+    if (line.startsWith('event:')) {
+      event = line.slice(6).trim();
+    } else if (line.startsWith('data:')) {
+      dataLines.push(line.slice(5).trim());
+    }
+  }
+  return { event, data: dataLines.length ? JSON.parse(dataLines.join('\n')) : {} };
+};
+
 export const api = {
   async getModels() {
     try {
@@ -137,19 +150,58 @@ export const api = {
     }
   },
 
-  async chatWithAgent(agentId: string, userMessage: string): Promise<ChatResponse> {
+  async chatWithAgent(
+    agentId: string,
+    userMessage: string,
+    onUpdate?: (partial: ChatResponse) => void,
+  ): Promise<ChatResponse> {
     const response = await fetch(`${API_BASE_URL}/agents/${agentId}/chat`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({ agent_id: agentId, user_message: userMessage }),
     });
-    if (!response.ok) {
+    if (!response.ok || !response.body) {
       const errorData = await response.json().catch(() => ({ detail: response.statusText }));
       const error = new Error(errorData.detail || 'Failed to chat with agent');
       (error as any).response = response;
       throw error;
     }
-    return response.json();
+
+    // The backend streams server-sent events: meta, delta*, optional error, done
+    const result: ChatResponse = { response: '', tools_used: [], tools_used_names: [], full_prompt: '' };
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let finished = false;
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        const { event, data } = parseSseFrame(buffer.slice(0, boundary));
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+        if (event === 'meta') {
+          result.tools_used = data.tools_used;
+          result.tools_used_names = data.tools_used_names;
+          result.full_prompt = data.full_prompt;
+        } else if (event === 'delta') {
+          result.response += data.text;
+          onUpdate?.({ ...result });
+        } else if (event === 'error') {
+          throw new Error(data.detail || 'Failed to chat with agent');
+        } else if (event === 'done') {
+          finished = true;
+        }
+      }
+    }
+    // A body that ends without "done" means the connection dropped mid-answer
+    if (!finished) {
+      throw new Error('Connection to the agent was lost before the response finished');
+    }
+    result.response = result.response.trim();
+    return result;
   },
 };
 